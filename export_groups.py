@@ -5,7 +5,7 @@ export_groups.py – Extract all unique group-titles per provider
 
 from pathlib import Path
 from m3u_merge.fetch import load_config, _cache_filename
-from m3u_merge.parse_m3u import read_m3u
+from m3u_merge.parse_m3u import read_m3u_cached
 import csv
 
 BASE = Path(__file__).resolve().parent
@@ -27,7 +27,7 @@ for p in cfg.providers:
         if not m3u_path.exists():
             continue
 
-        for ch in read_m3u(m3u_path):
+        for ch in read_m3u_cached(m3u_path):
             g = (ch.group_title or "").strip()
             if g:
                 provider_groups[prov_name].add(g)
@@ -36,11 +36,14 @@ for p in cfg.providers:
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Write CSV
-with OUT_CSV.open("w", newline="", encoding="utf-8") as f:
+rows = [
+    (prov, g)
+    for prov in sorted(provider_groups)
+    for g in sorted(provider_groups[prov], key=str.lower)
+]
+with OUT_CSV.open("w", newline="", encoding="utf-8", buffering=1 << 20) as f:
     w = csv.writer(f)
     w.writerow(["provider", "group_title"])
-    for prov in sorted(provider_groups):
-        for g in sorted(provider_groups[prov], key=str.lower):
-            w.writerow([prov, g])
+    w.writerows(rows)
 
 print(f"Wrote provider_groups.csv with {sum(len(v) for v in provider_groups.values())} rows")
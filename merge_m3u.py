@@ -7,12 +7,21 @@ Usage (from ~/m3u_merge):
     PYTHONPATH=src python3 merge_m3u.py
 """
 
+import os
+from contextlib import contextmanager
 from pathlib import Path
-import xml.etree.ElementTree as ET
 from collections import Counter
+from operator import itemgetter
+
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as LET
+except ImportError:  # fall back to the stdlib parser in step2_merge_epg
+    LET = None
 
 from m3u_merge.fetch import fetch_all, load_config, _cache_filename
-from m3u_merge.parse_m3u import read_m3u
+from m3u_merge.parse_m3u import read_m3u_rows_cached
 
 
 # ---------------------------------------------------------------------
@@ -50,6 +59,22 @@ def _debug_append(path: Path, text: str):
         # Silent fail – this is debug-only.
         pass
 
+@contextmanager
+def _atomic_output(path: Path):
+    """
+    Yield a sibling temp file to write `path` into; it is os.replace()d over
+    `path` once the block succeeds and removed if it fails. The name carries
+    the PID so overlapping runs never write into each other's temp file.
+    """
+    tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
 def step1_fetch():
     print("=== STEP 1: Fetching all providers into cache ===")
     DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -57,15 +82,8 @@ def step1_fetch():
     print("    Done fetch_all().")
 
 
-def step2_merge_epg():
-    print("=== STEP 2: Merging provider EPGs ===")
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    cfg = load_config(CONFIG_PATH)
-    tv_root = ET.Element("tv")
-
-    epg_channel_count = 0
-
+def _epg_sources(cfg):
+    """Yield every cached provider EPG file, in config order."""
     for p in cfg.providers:
         slug = p.slug
         for epg_url in p.epg_urls:
@@ -74,142 +92,106 @@ def step2_merge_epg():
                 continue
 
             print(f"  Merging EPG from: {epg_path}")
-            tree = ET.parse(epg_path)
-            root = tree.getroot()
-
-            # copy only <channel> and <programme> elements
-            for elem in root:
-                if elem.tag in ("channel", "programme"):
-                    tv_root.append(elem)
-                    if elem.tag == "channel":
-                        epg_channel_count += 1
-
-    tree_out = ET.ElementTree(tv_root)
-    tree_out.write(str(MERGED_EPG), encoding="UTF-8", xml_declaration=True)
-    print(f"  Wrote merged EPG to {MERGED_EPG}")
-    print(f"  Total <channel> elements in merged EPG: {epg_channel_count}")
+            yield epg_path
 
 
-"""def step3_merge_m3u():
-    print("=== STEP 3: Merging provider M3Us with sorted numbering ===")
-    cfg = load_config(CONFIG_PATH)
-
-    # We’ll collect ALL channels first, then sort, then number.
-    channels = []
+def _merge_epg_lxml(cfg) -> int:
+    epg_channel_count = 0
 
-    for p in cfg.providers:
-        prov_name = p.name.strip() or p.slug   # e.g. "Samsung", "Pluto", "Plex"
-        slug = p.slug
+    # Stream every provider EPG straight into the output file so we never
+    # hold more than one <channel>/<programme> element in memory at a time.
+    with _atomic_output(MERGED_EPG) as tmp, open(tmp, "wb") as out:
+        with LET.xmlfile(out, encoding="UTF-8") as xf:
+            xf.write_declaration()
+            with xf.element("tv"):
+                for epg_path in _epg_sources(cfg):
+                    # copy only <channel> and <programme> elements
+                    for _, elem in LET.iterparse(
+                        str(epg_path), events=("end",), tag=("channel", "programme")
+                    ):
+                        xf.write(elem)
+                        if elem.tag == "channel":
+                            epg_channel_count += 1
+                        elem.clear()
+                        while elem.getprevious() is not None:
+                            del elem.getparent()[0]
+
+    return epg_channel_count
+
+
+def _merge_epg_stdlib(cfg) -> int:
+    """Fallback when lxml is not installed: stdlib iterparse into one output tree."""
+    tv_root = ET.Element("tv")
+    epg_channel_count = 0
 
-        for m3u_url in p.m3u_urls:
-            m3u_path = _cache_filename("m3u", slug, m3u_url, DATA_DIR)
-            if not m3u_path.exists():
+    for epg_path in _epg_sources(cfg):
+        root = None
+        for event, elem in ET.iterparse(str(epg_path), events=("start", "end")):
+            if root is None:
+                root = elem  # first start event is the source <tv>
+                continue
+            if event != "end":
                 continue
 
-            print(f"  Reading M3U from: {m3u_path} ({prov_name})")
-            for ch in read_m3u(m3u_path):
-                tvg_id      = (ch.tvg_id or "").strip()
-                tvg_name    = (ch.tvg_name or ch.name or "").strip()
-                display_raw = (ch.name or tvg_name or tvg_id or ch.url).strip()
-                group       = (ch.group_title or "").strip()
-                url         = ch.url.strip()
-
-                channels.append({
-                    "prov_name":  prov_name,
-                    "slug":       slug,
-                    "tvg_id":     tvg_id,
-                    "tvg_name":   tvg_name,
-                    "display_raw": display_raw,
-                    "group":      group,
-                    "url":        url,
-                })
-
-    # --- Sort BEFORE numbering ---
-    # 1) by display_raw (case-insensitive)
-    # 2) then by prov_name, so e.g. "CBS News" (Plex) and "CBS News" (Pluto) group together.
-    channels.sort(
-        key=lambda c: (c["display_raw"].lower(), c["prov_name"].lower())
-    )
+            # copy only <channel> and <programme> elements, then drop them from
+            # the source tree so only the output tree stays resident
+            if elem.tag in ("channel", "programme"):
+                tv_root.append(elem)
+                if elem.tag == "channel":
+                    epg_channel_count += 1
+                root.clear()
 
-    # --- Now assign channel numbers from 100 upwards in that sorted order ---
-    lines = []
-    lines.append(f'#EXTM3U x-tvg-url="http://epg.mikefarris.biz/{MERGED_EPG.name}"')
+    with _atomic_output(MERGED_EPG) as tmp:
+        ET.ElementTree(tv_root).write(
+            str(tmp), encoding="UTF-8", xml_declaration=True, short_empty_elements=True
+        )
+    return epg_channel_count
 
-    prov_counts = Counter()
-    current_chno = 100
-
-    for c in channels:
-        prov_name   = c["prov_name"]
-        tvg_id      = c["tvg_id"]
-        tvg_name    = c["tvg_name"]
-        display_raw = c["display_raw"]
-        group       = c["group"]
-        url         = c["url"]
-
-        visible_name = f"{display_raw} ({prov_name})"
-        prov_counts[prov_name] += 1
-
-        chno = current_chno
-        current_chno += 1
-
-        # We IGNORE any upstream tvg-chno, and only set our own.
-        extinf = '#EXTINF:-1'
-        if tvg_id:
-            extinf += f' tvg-id="{tvg_id}"'
-        if tvg_name:
-            extinf += f' tvg-name="{tvg_name}"'
-        if group:
-            extinf += f' group-title="{group}"'
-        extinf += f' tvg-chno="{chno}"'
-        extinf += f',{visible_name}'
-
-        lines.append(extinf)
-        lines.append(url)
 
+def step2_merge_epg():
+    print("=== STEP 2: Merging provider EPGs ===")
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    with MERGED_M3U.open("w", encoding="utf-8", newline="\n") as f:
-        f.write("\n".join(lines) + "\n")
 
-    print(f"  Wrote merged M3U with provider tags to {MERGED_M3U}")
-    print("  Per-provider channel counts:")
-    for name, count in sorted(prov_counts.items()):
-        print(f"    {name}: {count}")
-    print(f"  Total channels written: {sum(prov_counts.values())}")
-    print(f"  Final channel number used: {current_chno - 1}")"""
-    
-    
-def step3_merge_m3u():
-    print("=== STEP 3: Merging provider M3Us with sorted numbering ===")
     cfg = load_config(CONFIG_PATH)
 
-    # Reset debug files at the start of each run
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    _debug_reset_files()
+    if LET is not None:
+        epg_channel_count = _merge_epg_lxml(cfg)
+    else:
+        epg_channel_count = _merge_epg_stdlib(cfg)
+
+    print(f"  Wrote merged EPG to {MERGED_EPG}")
+    print(f"  Total <channel> elements in merged EPG: {epg_channel_count}")
 
-    # Collect ALL channels first, then sort, then number.
-    channels = []
 
+def iter_provider_channels(cfg, data_dir: Path):
+    """
+    Yield one flat tuple per cached M3U channel, in config order:
+      (display_lower, prov_lower, prov_name, slug, tvg_id, tvg_name, display_raw, group, url)
+    The sort keys sit at positions 0-1 so callers can sort with itemgetter(0, 1).
+    """
     for p in cfg.providers:
         prov_name = p.name.strip() or p.slug   # e.g. "Samsung", "Pluto", "Plex"
+        prov_lower = prov_name.lower()
         slug = p.slug
+        debug = "samsung" in slug.lower() or "samsung" in prov_lower
 
         for m3u_url in p.m3u_urls:
-            m3u_path = _cache_filename("m3u", slug, m3u_url, DATA_DIR)
+            m3u_path = _cache_filename("m3u", slug, m3u_url, data_dir)
             if not m3u_path.exists():
                 continue
 
             print(f"  Reading M3U from: {m3u_path} ({prov_name})")
 
-            for ch in read_m3u(m3u_path):
-                # Raw parsed values straight from read_m3u()
-                tvg_id_raw      = (ch.tvg_id or "").strip()
-                tvg_name_raw    = (ch.tvg_name or "").strip()
-                name_raw        = (ch.name or "").strip()
-                group_raw       = (ch.group_title or "").strip()
-                url_raw         = (ch.url or "").strip()
+            for ch_name, ch_url, ch_tvg_id, ch_tvg_name, ch_group, _ in read_m3u_rows_cached(m3u_path):
+                # Raw parsed values straight from the parser
+                tvg_id_raw      = (ch_tvg_id or "").strip()
+                tvg_name_raw    = (ch_tvg_name or "").strip()
+                name_raw        = (ch_name or "").strip()
+                group_raw       = (ch_group or "").strip()
+                url_raw         = (ch_url or "").strip()
 
                 # DEBUG 1: Log how Samsung channels look *immediately* after parse
-                if "samsung" in slug.lower() or "samsung" in prov_name.lower():
+                if debug:
                     _debug_append(
                         DEBUG_PARSED,
                         f"[PARSED] slug={slug!r}, prov={prov_name!r}, "
@@ -225,7 +207,7 @@ def step3_merge_m3u():
                 url         = url_raw
 
                 # DEBUG 2: Log the mapped fields that will be used in sorting/numbering
-                if "samsung" in slug.lower() or "samsung" in prov_name.lower():
+                if debug:
                     _debug_append(
                         DEBUG_MAPPED,
                         f"[MAPPED] slug={slug!r}, prov={prov_name!r}, "
@@ -233,65 +215,67 @@ def step3_merge_m3u():
                         f"tvg-name={tvg_name!r}, group={group!r}, url={url!r}"
                     )
 
-                channels.append({
-                    "prov_name":  prov_name,
-                    "slug":       slug,
-                    "tvg_id":     tvg_id,
-                    "tvg_name":   tvg_name,
-                    "display_raw": display_raw,
-                    "group":      group,
-                    "url":        url,
-                })
+                yield (display_raw.lower(), prov_lower, prov_name, slug,
+                       tvg_id, tvg_name, display_raw, group, url)
+
+
+def step3_merge_m3u():
+    print("=== STEP 3: Merging provider M3Us with sorted numbering ===")
+    cfg = load_config(CONFIG_PATH)
+
+    # Reset debug files at the start of each run
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    _debug_reset_files()
+
+    # Collect ALL channels first, then sort, then number.
+    channels = list(iter_provider_channels(cfg, DATA_DIR))
 
     # --- Sort BEFORE numbering ---
-    channels.sort(
-        key=lambda c: (c["display_raw"].lower(), c["prov_name"].lower())
-    )
+    # (display_raw lower, prov_name lower); the sort is stable so ties keep input order.
+    channels.sort(key=itemgetter(0, 1))
 
     # --- Now assign channel numbers from 100 upwards in that sorted order ---
-    lines = []
-    lines.append(f'#EXTM3U x-tvg-url="http://epg.mikefarris.biz/{MERGED_EPG.name}"')
+    header = f'#EXTM3U x-tvg-url="http://epg.mikefarris.biz/{MERGED_EPG.name}"'
 
     prov_counts = Counter()
-    current_chno = 100
-
-    for c in channels:
-        prov_name   = c["prov_name"]
-        tvg_id      = c["tvg_id"]
-        tvg_name    = c["tvg_name"]
-        display_raw = c["display_raw"]
-        group       = c["group"]
-        url         = c["url"]
-
-        visible_name = f"{display_raw} ({prov_name})"
-        prov_counts[prov_name] += 1
-
-        chno = current_chno
-        current_chno += 1
-
-        # We IGNORE any upstream tvg-chno, and only set our own.
-        extinf = '#EXTINF:-1'
-        if tvg_id:
-            extinf += f' tvg-id="{tvg_id}"'
-        if tvg_name:
-            extinf += f' tvg-name="{tvg_name}"'
-        if group:
-            extinf += f' group-title="{group}"'
-        extinf += f' tvg-chno="{chno}"'
-        extinf += f',{visible_name}'
-
-        lines.append(extinf)
-        lines.append(url)
-
-        # DEBUG 3: See exactly what we *actually* wrote for Samsung channels
-        if "samsung" in c["slug"].lower() or "samsung" in prov_name.lower():
-            _debug_append(
-                DEBUG_FINAL,
-                f"[FINAL] {extinf}\n[URL]   {url}"
-            )
-
-    with MERGED_M3U.open("w", encoding="utf-8", newline="\n") as f:
-        f.write("\n".join(lines) + "\n")
+    first_chno = 100
+
+    # Stream to disk through a reusable bytearray, flushed in ~1 MiB batches.
+    buf = bytearray()
+    with _atomic_output(MERGED_M3U) as tmp, open(tmp, "wb") as f:
+        buf += header.encode("utf-8")
+        buf += b"\n"
+
+        for chno, (_, prov_lower, prov_name, slug, tvg_id, tvg_name, display_raw, group, url) in enumerate(
+            channels, start=first_chno
+        ):
+            visible_name = f"{display_raw} ({prov_name})"
+            prov_counts[prov_name] += 1
+
+            # We IGNORE any upstream tvg-chno, and only set our own.
+            id_part    = f' tvg-id="{tvg_id}"' if tvg_id else ''
+            name_part  = f' tvg-name="{tvg_name}"' if tvg_name else ''
+            group_part = f' group-title="{group}"' if group else ''
+            extinf = f'#EXTINF:-1{id_part}{name_part}{group_part} tvg-chno="{chno}",{visible_name}'
+
+            buf += extinf.encode("utf-8")
+            buf += b"\n"
+            buf += url.encode("utf-8")
+            buf += b"\n"
+            if len(buf) >= 1 << 20:
+                f.write(buf)
+                buf.clear()
+
+            # DEBUG 3: See exactly what we *actually* wrote for Samsung channels
+            if "samsung" in slug.lower() or "samsung" in prov_lower:
+                _debug_append(
+                    DEBUG_FINAL,
+                    f"[FINAL] {extinf}\n[URL]   {url}"
+                )
+
+        f.write(buf)
+
+    current_chno = first_chno + sum(prov_counts.values())
 
     print(f"  Wrote merged M3U with provider tags to {MERGED_M3U}")
     print("  Per-provider channel counts:")
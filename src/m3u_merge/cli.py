@@ -3,7 +3,7 @@ import argparse, csv
 from pathlib import Path
 from typing import List
 from .fetch import load_config, _cache_filename
-from .parse_m3u import read_m3u
+from .parse_m3u import count_m3u
 from .parse_epg import scan_epg_counts
 from .reconcile import build_suggestions
 
@@ -13,16 +13,11 @@ def cmd_map(config: Path, data_dir: Path, reports_dir: Path) -> Path:
       provider, kind (m3u/epg), source_url, cached_file,
       channels_found, programmes_found, tvg_id_count, missing_tvg_id_count, notes
     """
-    from .fetch import load_config, _cache_filename
-    from .parse_m3u import read_m3u
-    from .parse_epg import scan_epg_counts
-    import csv
-
     cfg = load_config(config)
     reports_dir.mkdir(parents=True, exist_ok=True)
     out = reports_dir / "channel_map.csv"
 
-    with out.open("w", newline="", encoding="utf-8") as f:
+    with out.open("w", newline="", encoding="utf-8", buffering=1 << 20) as f:
         w = csv.writer(f)
         w.writerow([
             "provider", "kind", "source_url", "cached_file",
@@ -30,6 +25,8 @@ def cmd_map(config: Path, data_dir: Path, reports_dir: Path) -> Path:
             "tvg_id_count", "missing_tvg_id_count", "notes"
         ])
 
+        # Collect rows in report order and hand them to the writer in one batch
+        rows = []
         for prov in cfg.providers:
             prov_name = prov.name.strip().lower()
 
@@ -50,7 +47,7 @@ def cmd_map(config: Path, data_dir: Path, reports_dir: Path) -> Path:
                     except Exception as e:
                         notes = f"EPG parse error: {e.__class__.__name__}: {e}"
                         ch_count = prog_count = 0
-                w.writerow([
+                rows.append([
                     prov_name, "epg", epg_url, str(cached),
                     ch_count, prog_count, "", "", notes
                 ])
@@ -62,19 +59,16 @@ def cmd_map(config: Path, data_dir: Path, reports_dir: Path) -> Path:
                 notes = ""
                 if cached.exists():
                     try:
-                        for ch in read_m3u(cached):
-                            ch_count += 1
-                            if ch.tvg_id:
-                                tvg_count += 1
-                            else:
-                                missing_count += 1
+                        ch_count, tvg_count, missing_count = count_m3u(cached)
                     except Exception as e:
                         notes = f"M3U parse error: {e.__class__.__name__}: {e}"
-                w.writerow([
+                rows.append([
                     prov_name, "m3u", m3u_url, str(cached),
                     ch_count, "", tvg_count, missing_count, notes
                 ])
 
+        w.writerows(rows)
+
     return out
 
 def main():
@@ -1,18 +1,34 @@
 from __future__ import annotations
 
 import argparse
+import functools
 import hashlib
 import json
 import logging
+import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import requests
 import yaml
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _DUMP_OPTS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+# Shared session so TCP/TLS connections are reused across URLs and worker threads.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
 
 
 @dataclass
@@ -22,6 +38,7 @@ class FetchSettings:
     backoff: float = 1.5
     honor_etag: bool = True
     honor_last_modified: bool = True
+    max_workers: int = 16
 
 
 @dataclass
@@ -44,12 +61,24 @@ class ProvidersConfig:
     fetch: FetchSettings
 
 
+# libyaml-backed loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# config_path -> (st_mtime_ns, parsed config)
+_CFG_CACHE: Dict[Path, Tuple[int, ProvidersConfig]] = {}
+
+
 def _load_yaml(path: Path) -> dict:
     with path.open("r", encoding="utf-8") as f:
-        return yaml.safe_load(f) or {}
+        return yaml.load(f, Loader=_YAML_LOADER) or {}
 
 
 def load_config(config_path: Path) -> ProvidersConfig:
+    mtime = config_path.stat().st_mtime_ns
+    cached = _CFG_CACHE.get(config_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
     raw = _load_yaml(config_path)
 
     fetch = raw.get("fetch", {}) or {}
@@ -59,6 +88,7 @@ def load_config(config_path: Path) -> ProvidersConfig:
         backoff=float(fetch.get("backoff", 1.5)),
         honor_etag=bool(fetch.get("honor_etag", True)),
         honor_last_modified=bool(fetch.get("honor_last_modified", True)),
+        max_workers=int(fetch.get("max_workers", 16)),
     )
 
     provs: List[Provider] = []
@@ -73,11 +103,14 @@ def load_config(config_path: Path) -> ProvidersConfig:
             )
         )
 
-    return ProvidersConfig(providers=provs, fetch=settings)
+    cfg = ProvidersConfig(providers=provs, fetch=settings)
+    _CFG_CACHE[config_path] = (mtime, cfg)
+    return cfg
 
 
+@functools.lru_cache(maxsize=4096)
 def _hash_url(url: str) -> str:
-    import hashlib
+    # cache file names derive from this; changing it orphans every cached file
     return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
 
 
@@ -94,8 +127,15 @@ def _read_meta(meta_file: Path) -> dict:
     return {}
 
 
+def _write_json(path: Path, obj) -> None:
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(obj, option=_DUMP_OPTS))
+    else:
+        path.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
 def _write_meta(meta_file: Path, meta: dict) -> None:
-    meta_file.write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+    _write_json(meta_file, meta)
 
 
 def _auth_tuple(auth: Optional[Dict[str, str]]):
@@ -115,16 +155,32 @@ def _conditional_headers(existing_meta: dict, settings: FetchSettings) -> Dict[s
     return h
 
 
-def _save_response(dst: Path, resp: requests.Response) -> tuple[Path, dict]:
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def _save_response(dst: Path, resp: requests.Response, run_ts: Optional[str] = None) -> tuple[Path, dict]:
     dst.parent.mkdir(parents=True, exist_ok=True)
-    with dst.open("wb") as f:
-        f.write(resp.content)
+    # Stream the (decoded) body to a side file so a dropped connection never
+    # clobbers the previous good cache entry.
+    tmp = dst.with_suffix(dst.suffix + ".part")
+    size = 0
+    try:
+        with tmp.open("wb") as f:
+            for chunk in resp.iter_content(chunk_size=1 << 20):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, dst)
+    except BaseException:
+        # e.g. ChunkedEncodingError mid-body: don't leave the partial behind
+        tmp.unlink(missing_ok=True)
+        raise
 
     meta = {
         "url": resp.url,
         "status": resp.status_code,
-        "size": len(resp.content),
-        "fetched_at": datetime.utcnow().isoformat() + "Z",
+        "size": size,
+        "fetched_at": run_ts or _utc_now_iso(),
         "etag": resp.headers.get("ETag"),
         "last_modified": resp.headers.get("Last-Modified"),
         "content_type": resp.headers.get("Content-Type"),
@@ -155,37 +211,39 @@ def fetch_url(
     auth,
     settings: FetchSettings,
     logger: logging.Logger,
+    run_ts: Optional[str] = None,
 ):
     meta_file = _meta_path(dst)
     existing_meta = _read_meta(meta_file)
     req_headers = dict(headers or {})
+    req_headers.setdefault("Accept-Encoding", requests.utils.DEFAULT_ACCEPT_ENCODING)
     req_headers.update(_conditional_headers(existing_meta, settings))
 
     attempt = 0
     last_exc = None
     while attempt <= settings.retries:
         try:
-            resp = requests.get(url, headers=req_headers, auth=auth, timeout=settings.timeout_secs)
-            if resp.status_code == 304:
-                if dst.exists():
-                    logger.info("304 Not Modified: %s", url)
-                    existing_meta["status"] = 304
-                    existing_meta.setdefault("not_modified_at", datetime.utcnow().isoformat() + "Z")
-                    return dst, existing_meta
-                else:
-                    logger.warning("304 but no cache for %s; retrying without conditionals.", url)
-                    req_headers.pop("If-None-Match", None)
-                    req_headers.pop("If-Modified-Since", None)
-                    attempt += 1
-                    continue
-
-            if 200 <= resp.status_code < 300:
-                saved_path, meta = _save_response(dst, resp)
-                meta["last_modified_iso"] = _http_date_to_utc_iso(meta.get("last_modified"))
-                logger.info("200 OK (%s bytes): %s", meta["size"], url)
-                return saved_path, meta
-
-            logger.warning("HTTP %s for %s", resp.status_code, url)
+            with _SESSION.get(url, headers=req_headers, auth=auth, timeout=settings.timeout_secs, stream=True) as resp:
+                if resp.status_code == 304:
+                    if dst.exists():
+                        logger.info("304 Not Modified: %s", url)
+                        existing_meta["status"] = 304
+                        existing_meta.setdefault("not_modified_at", run_ts or _utc_now_iso())
+                        return dst, existing_meta
+                    else:
+                        logger.warning("304 but no cache for %s; retrying without conditionals.", url)
+                        req_headers.pop("If-None-Match", None)
+                        req_headers.pop("If-Modified-Since", None)
+                        attempt += 1
+                        continue
+
+                if 200 <= resp.status_code < 300:
+                    saved_path, meta = _save_response(dst, resp, run_ts)
+                    meta["last_modified_iso"] = _http_date_to_utc_iso(meta.get("last_modified"))
+                    logger.info("200 OK (%s bytes): %s", meta["size"], url)
+                    return saved_path, meta
+
+                logger.warning("HTTP %s for %s", resp.status_code, url)
 
         except requests.RequestException as e:
             last_exc = e
@@ -206,26 +264,42 @@ def fetch_url(
     return None, {"error": str(last_exc) if last_exc else "fetch failed"}
 
 
-def fetch_provider(provider: Provider, settings: FetchSettings, data_dir: Path, logger: logging.Logger) -> dict:
-    headers = dict(provider.headers or {})
-    auth_tuple = _auth_tuple(provider.auth)
-
-    results = {
+def _provider_results(provider: Provider) -> dict:
+    return {
         "provider": provider.name,
         "slug": provider.slug,
         "m3u": [],
         "epg": [],
     }
 
-    for url in provider.m3u_urls:
-        dst = _cache_filename("m3u", provider.slug, url, data_dir)
-        path, meta = fetch_url(url, dst, headers, auth_tuple, settings, logger)
-        results["m3u"].append({"url": url, "path": str(path) if path else None, "meta": meta})
 
+def _provider_tasks(provider: Provider, data_dir: Path) -> List[Tuple[str, str, Path]]:
+    """
+    Flatten a provider into (kind, url, dst) fetch tasks, m3u first then epg.
+    """
+    tasks = []
+    for url in provider.m3u_urls:
+        tasks.append(("m3u", url, _cache_filename("m3u", provider.slug, url, data_dir)))
     for url in provider.epg_urls:
-        dst = _cache_filename("epg", provider.slug, url, data_dir)
-        path, meta = fetch_url(url, dst, headers, auth_tuple, settings, logger)
-        results["epg"].append({"url": url, "path": str(path) if path else None, "meta": meta})
+        tasks.append(("epg", url, _cache_filename("epg", provider.slug, url, data_dir)))
+    return tasks
+
+
+def fetch_provider(
+    provider: Provider,
+    settings: FetchSettings,
+    data_dir: Path,
+    logger: logging.Logger,
+    run_ts: Optional[str] = None,
+) -> dict:
+    headers = dict(provider.headers or {})
+    auth_tuple = _auth_tuple(provider.auth)
+
+    results = _provider_results(provider)
+
+    for kind, url, dst in _provider_tasks(provider, data_dir):
+        path, meta = fetch_url(url, dst, headers, auth_tuple, settings, logger, run_ts)
+        results[kind].append({"url": url, "path": str(path) if path else None, "meta": meta})
 
     return results
 
@@ -243,15 +317,46 @@ def fetch_all(config_path: Path, data_dir: Path, verbose: bool = False):
     data_dir.mkdir(parents=True, exist_ok=True)
     (data_dir / "cache").mkdir(parents=True, exist_ok=True)
 
+    # One timestamp for the whole run; used for fetched_at / not_modified_at.
+    run_ts = _utc_now_iso()
+
+    # Fetch every URL of every provider concurrently; the work is network-bound.
     summaries = []
-    for p in cfg.providers:
-        if not p.name:
-            logger.warning("Skipping provider with no name.")
-            continue
-        summaries.append(fetch_provider(p, cfg.fetch, data_dir, logger))
+    slots: Dict[Tuple[int, str, int], dict] = {}
+    with ThreadPoolExecutor(max_workers=max(1, cfg.fetch.max_workers)) as pool:
+        # Tasks sharing a dst (same URL listed twice, or two providers with the
+        # same slug) are fetched once; writing one cache file from two threads
+        # races on its .part/.meta.json. The single result fills every slot.
+        by_dst: Dict[Path, Future] = {}
+        futures: Dict[Future, List[Tuple[int, str, int, str]]] = {}
+        for p in cfg.providers:
+            if not p.name:
+                logger.warning("Skipping provider with no name.")
+                continue
+            summary_idx = len(summaries)
+            summaries.append(_provider_results(p))
+            headers = dict(p.headers or {})
+            auth_tuple = _auth_tuple(p.auth)
+            for task_idx, (kind, url, dst) in enumerate(_provider_tasks(p, data_dir)):
+                fut = by_dst.get(dst)
+                if fut is None:
+                    fut = pool.submit(fetch_url, url, dst, headers, auth_tuple, cfg.fetch, logger, run_ts)
+                    by_dst[dst] = fut
+                    futures[fut] = []
+                futures[fut].append((summary_idx, kind, task_idx, url))
+
+        for fut in as_completed(futures):
+            path, meta = fut.result()
+            for summary_idx, kind, task_idx, url in futures[fut]:
+                slots[(summary_idx, kind, task_idx)] = {"url": url, "path": str(path) if path else None, "meta": meta}
+
+    # Collate back in config order so the summary is stable between runs.
+    for key in sorted(slots):
+        summary_idx, kind, _ = key
+        summaries[summary_idx][kind].append(slots[key])
 
     summary_path = data_dir / "cache" / "fetch-summary.json"
-    summary_path.write_text(json.dumps(summaries, indent=2, ensure_ascii=False), encoding="utf-8")
+    _write_json(summary_path, summaries)
     return summaries
 
 
@@ -4,6 +4,10 @@ from pathlib import Path
 from typing import Dict, List
 from lxml import etree
 
+# libxml2 options shared by every EPG scan: XMLTV never needs the ID table,
+# blank text nodes, or entity expansion.
+_EPG_PARSE_OPTS = dict(collect_ids=False, remove_blank_text=True, huge_tree=True, resolve_entities=False)
+
 @dataclass
 class EPGChannel:
     id: str
@@ -14,17 +18,31 @@ class EPGCounts:
     channels: int
     programmes: int
 
+class _CountTarget:
+    """Parser target that only counts tags; no element objects are built."""
+    __slots__ = ("ch", "pr")
+
+    def __init__(self):
+        self.ch = self.pr = 0
+
+    def start(self, tag, attrib):
+        if tag == "channel": self.ch += 1
+        elif tag == "programme": self.pr += 1
+
+    def end(self, tag):
+        pass
+
+    def close(self):
+        return (self.ch, self.pr)
+
 def scan_epg_counts(path: Path) -> EPGCounts:
-    ch = pr = 0
-    for _, elem in etree.iterparse(str(path), events=("end",), tag=("channel","programme")):
-        if elem.tag == "channel": ch += 1
-        elif elem.tag == "programme": pr += 1
-        elem.clear()
+    parser = etree.XMLParser(target=_CountTarget(), **_EPG_PARSE_OPTS)
+    ch, pr = etree.parse(str(path), parser)
     return EPGCounts(channels=ch, programmes=pr)
 
 def read_epg_channels(path: Path) -> Dict[str, EPGChannel]:
     out: Dict[str, EPGChannel] = {}
-    for _, elem in etree.iterparse(str(path), events=("end",), tag=("channel",)):
+    for _, elem in etree.iterparse(str(path), events=("end",), tag=("channel",), **_EPG_PARSE_OPTS):
         cid = elem.get("id") or ""
         names = [dn.text.strip() for dn in elem.findall("display-name") if dn.text]
         if cid:
@@ -1,12 +1,25 @@
 from __future__ import annotations
+import os
+import pickle
 import re
+import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterator, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 # parse_m3u.py version 1.0.6
 
+# Lines are scanned as raw bytes; only the fields we keep get decoded.
+# key="value" pairs inside the EXTINF attribute section
+_ATTR_RE = re.compile(rb'([A-Za-z0-9_\-]+)\s*=\s*"([^"]*)"')
+# attr section made only of key="value" pairs; anything else is parsed loosely
+_CLEAN_ATTRS_RE = re.compile(rb'(?:\s*[A-Za-z0-9_\-]+\s*=\s*"[^"]*")*\s*')
+# header up to (not including) the first comma that is not inside quotes
+_EXTINF_HEAD_RE = re.compile(rb'(?:[^,"]|"[^"]*")*')
+# well-formed EXTINF line in one pass: duration, key="value" attrs, then ",name"
+_EXTINF_RE = re.compile(rb'#EXTINF:-?\d+(?: +((?:[A-Za-z0-9_\-]+="[^"]*"\s*)*))?,(.*)', re.S)
 
-@dataclass
+
+@dataclass(slots=True)
 class M3UChannel:
     name: str
     url: str
@@ -16,46 +29,117 @@ class M3UChannel:
     raw_attrs: Optional[Dict[str, str]] = None
 
 
-def _parse_extinf_attrs(attr_str: str) -> Dict[str, str]:
+def _decode(b: bytes) -> str:
+    return b.decode("utf-8", "ignore")
+
+
+# what str.strip() removes from ASCII text (bytes.strip() keeps \x1c-\x1f)
+_ASCII_WS = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+
+
+def _str_strip(b: bytes) -> bytes:
     """
-    Parse key="value" pairs from the EXTINF attribute section.
+    bytes equivalent of str.strip() on the decoded text.
+    """
+    if b.isascii():
+        return b.strip(_ASCII_WS)
+    # decode like the text reader so unicode whitespace (NBSP, ...) is
+    # stripped too, e.g. a "\xa0#EXTINF:" line stays a directive
+    return _decode(b).strip().encode("utf-8")
+
+
+def _parse_attrs_loose(attr_str: str) -> Dict[str, str]:
+    """
+    Char-by-char attr parser for malformed sections _CLEAN_ATTRS_RE rejects
+    (stray words, unbalanced quotes, ...). Kept as-is so such lines parse
+    exactly as they always did.
     """
     attrs: Dict[str, str] = {}
     key: Optional[str] = None
     buf: list[str] = []
     in_quotes = False
 
-    i = 0
-    while i < len(attr_str):
-        ch = attr_str[i]
-
+    for ch in attr_str:
         if ch == '"':
             in_quotes = not in_quotes
             if not in_quotes and key is not None:
-                # closing quote: commit the current buffer as value
                 attrs[key] = "".join(buf)
                 key = None
                 buf = []
-            i += 1
             continue
 
         if not in_quotes and ch.isspace():
-            i += 1
             continue
 
         if not in_quotes and ch == "=" and key is None:
-            # what we have in buf so far is the key
             key = "".join(buf)
             buf = []
-            i += 1
             continue
 
         buf.append(ch)
-        i += 1
 
     return attrs
 
 
+def _parse_extinf_attrs(attr_str: bytes) -> Dict[str, str]:
+    """
+    Parse key="value" pairs from the EXTINF attribute section.
+    """
+    if _CLEAN_ATTRS_RE.fullmatch(attr_str) is None:
+        return _parse_attrs_loose(_decode(attr_str))
+    return {m.group(1).decode("ascii"): _decode(m.group(2)) for m in _ATTR_RE.finditer(attr_str)}
+
+
+# (tvg_id, channel_id, tvg_name, tvc_guide_title, group_title)
+_Wanted = Tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]
+_NO_WANTED: _Wanted = (None, None, None, None, None)
+
+
+def _extract_wanted(attr_str: bytes) -> _Wanted:
+    """
+    Like _parse_extinf_attrs(), but only keeps the five keys the parser reads;
+    unknown ones are skipped without decoding.
+    """
+    if _CLEAN_ATTRS_RE.fullmatch(attr_str) is None:
+        attrs = _parse_attrs_loose(_decode(attr_str))
+        return (attrs.get("tvg-id"), attrs.get("channel-id"), attrs.get("tvg-name"),
+                attrs.get("tvc-guide-title"), attrs.get("group-title"))
+
+    tvg_id = channel_id = tvg_name = tvc_guide_title = group_title = None
+    for m in _ATTR_RE.finditer(attr_str):
+        k = m.group(1)
+        if k == b"tvg-id": tvg_id = _decode(m.group(2))
+        elif k == b"tvg-name": tvg_name = _decode(m.group(2))
+        elif k == b"group-title": group_title = _decode(m.group(2))
+        elif k == b"channel-id": channel_id = _decode(m.group(2))
+        elif k == b"tvc-guide-title": tvc_guide_title = _decode(m.group(2))
+    return (tvg_id, channel_id, tvg_name, tvc_guide_title, group_title)
+
+
+# UTF-8 two-byte sequences misread as Latin-1 ("Ã±" -> "ñ", "Â " -> NBSP, ...),
+# built once from every lead/continuation byte pair.
+_MOJIBAKE = {
+    bytes((lead, cont)).decode("latin1"): bytes((lead, cont)).decode("utf-8")
+    for lead in range(0xC2, 0xE0)
+    for cont in range(0x80, 0xC0)
+}
+# any 2/3/4-byte UTF-8 sequence seen as Latin-1 chars (box-drawing dashes,
+# emoji and the like take three or four)
+_MOJI_RE = re.compile("[\xc2-\xdf][\x80-\xbf]|[\xe0-\xef][\x80-\xbf]{2}|[\xf0-\xf4][\x80-\xbf]{3}")
+
+
+def _unmojibake(m: re.Match) -> str:
+    s = m.group(0)
+    fixed = _MOJIBAKE.get(s)
+    if fixed is not None:
+        return fixed
+    try:
+        return s.encode("latin1").decode("utf-8")
+    except UnicodeDecodeError:
+        # not a real UTF-8 sequence (overlong, surrogate, ...): leave it alone
+        return s
+
+
 def _normalize_group_title(group: Optional[str]) -> Optional[str]:
     """
     Normalize group-title strings.
@@ -65,146 +149,225 @@ def _normalize_group_title(group: Optional[str]) -> Optional[str]:
 
     g = group.strip()
 
+    # --- Fast accept: plain single-spaced ASCII has nothing to fix ---
+    if g.isascii() and g.isprintable() and "  " not in g and " + " not in g:
+        return g or None
+
     # --- Fix typical UTF-8-as-Latin1 mojibake ---
     if "Ã" in g or "Â" in g:
-        try:
-            g = g.encode("latin1").decode("utf-8")
-        except UnicodeError:
-            pass
+        g = _MOJI_RE.sub(_unmojibake, g)
 
     # --- Normalize " + " to " & " ---
     g = g.replace(" + ", " & ")
 
     # --- Collapse multiple spaces ---
-    g = " ".join(g.split())
+    # Every whitespace char other than " " is non-printable, so this guard
+    # skips the split/join for the usual already single-spaced title.
+    if "  " in g or not g.isprintable():
+        g = " ".join(g.split())
 
     return g or None
 
 
-def _split_extinf_line(line: str) -> tuple[str, str]:
+def _split_extinf_line(line: bytes) -> tuple[bytes, bytes]:
     """
     Safely splits an #EXTINF line into (attributes, name).
     It looks for the first comma that is NOT inside quotes.
     """
-    # Strip '#EXTINF:' prefix if present
-    if line.startswith("#EXTINF:"):
-        # Skip the tag itself
-        start_idx = 8
-    else:
-        start_idx = 0
+    split_index = _EXTINF_HEAD_RE.match(line).end()
+    if line[split_index:split_index + 1] == b",":
+        # header part contains "#EXTINF:-1 tvg-id...", name part "My Channel Name"
+        return line[:split_index], line[split_index + 1:]
+    # No comma found (or an unclosed quote)? Treat whole thing as header, empty name
+    return line, b""
 
-    in_quotes = False
-    split_index = -1
 
-    # Scan the string starting after #EXTINF:
-    for i in range(start_idx, len(line)):
-        ch = line[i]
+def _extinf_parts(line: bytes) -> Tuple[bytes, bytes]:
+    """
+    Split an #EXTINF line into (attr_str, name), attr_str without the duration.
+    """
+    m = _EXTINF_RE.match(line)
+    if m is not None:
+        return m.group(1) or b"", m.group(2)
 
-        if ch == '"':
-            in_quotes = not in_quotes
-        
-        # Found the separator comma?
-        if ch == ',' and not in_quotes:
-            split_index = i
-            break
-    
-    if split_index != -1:
-        # Everything before comma (minus #EXTINF:) is metadata
-        # Everything after is the channel name
-        # We slice from 0 to keep original indices aligned conceptually, 
-        # but effectively we want header part vs name part.
-        
-        # If there was an #EXTINF prefix, we might want to remove the duration logic here?
-        # Actually, easiest is just to return the raw chunks.
-        
-        header_part = line[:split_index] # Contains "#EXTINF:-1 tvg-id..."
-        name_part = line[split_index+1:] # Contains "My Channel Name"
-        return header_part, name_part
-    else:
-        # No comma found? Treat whole thing as header (weird) or empty name
-        return line, ""
-
-
-def read_m3u(path: Path) -> Iterator[M3UChannel]:
-    """
-    Parses M3U using a robust char-by-char splitter to handle commas in attributes.
-    """
-    with path.open("r", encoding="utf-8", errors="ignore") as f:
-        last_attrs: Dict[str, str] | None = None
-        last_name: Optional[str] = None
-
-        for raw in f:
-            line = raw.strip()
-            if not line:
-                continue
+    # === ROBUST SPLIT ===
+    # We split at the first comma that isn't quoted.
+    header_raw, name = _split_extinf_line(line)
 
-            if line.startswith("#EXTM3U"):
-                continue
+    # header_raw looks like: b'#EXTINF:-1 tvg-id="x"'
+    # Remove "#EXTINF:" prefix, then separate the duration (first
+    # token, e.g. -1 or 0) from the attr string at the first space.
+    # No space found? Assume no attrs.
+    clean_header = _str_strip(header_raw[8:])
+    _, _, attr_str = clean_header.partition(b" ")
+    return attr_str, name
 
-            if line.startswith("#EXTINF:"):
-                # === ROBUST SPLIT ===
-                # We manually split at the first comma that isn't quoted.
-                header_raw, name = _split_extinf_line(line)
-                
-                # header_raw looks like: "#EXTINF:-1 tvg-id="x""
-                # We need to isolate the attributes. 
-                # Usually distinct from duration by a space.
-                
-                # Remove "#EXTINF:" prefix for processing
-                clean_header = header_raw.replace("#EXTINF:", "", 1).strip()
-                
-                # Attempt to separate duration from attributes. 
-                # Duration is usually the first token (e.g. -1 or 0).
-                # We look for the first space.
-                parts = clean_header.split(" ", 1)
-                
-                if len(parts) > 1:
-                    # parts[0] is duration, parts[1] is attr string
-                    attr_str = parts[1]
-                else:
-                    # No space found? Could be "#EXTINF:-1" with no attrs
-                    # Or weirdly formatted. Assume no attrs if no space separator.
-                    attr_str = ""
-
-                attrs = _parse_extinf_attrs(attr_str)
-
-                # --- DEBUGGING (Optional: Uncomment if a specific group still fails) ---
-                # if "News, Weather" in raw:
-                #     print(f"DEBUG: Found line: {line}")
-                #     print(f"DEBUG: Split Name: {name}")
-                #     print(f"DEBUG: Attr Str:   {attr_str}")
-                #     print(f"DEBUG: Parsed:     {attrs}")
-                # ---------------------------------------------------------------------
-
-                last_attrs = attrs
-                last_name = name.strip()
-                continue
 
-            if line.startswith("#"):
+# (name, url, tvg_id, tvg_name, group_title, raw_attrs)
+M3URow = Tuple[str, str, Optional[str], Optional[str], Optional[str], Optional[Dict[str, str]]]
+
+
+def _iter_lines(path: Path) -> Iterator[bytes]:
+    """
+    Read the file in one go and yield its non-empty, stripped lines as bytes.
+    Lines come out exactly as the old text-mode reader saw them after str.strip().
+    """
+    with path.open("rb") as f:
+        data = f.read()
+
+    # bytes.splitlines() breaks on \n, \r and \r\n only: the same universal
+    # newlines the old text-mode reader used (CR-only playlists included)
+    for line in data.splitlines():
+        line = _str_strip(line)
+        if line:
+            yield line
+
+
+def _iter_m3u_rows(path: Path, include_raw_attrs: bool = False) -> Iterator[M3URow]:
+    """
+    Core M3U scanner shared by read_m3u() and read_m3u_rows().
+    Lines are handled as bytes; yields plain tuples. The general raw_attrs
+    dict is only built when include_raw_attrs is set (else the slot is None).
+    """
+    last_attrs: _Wanted | None = None
+    last_raw: Dict[str, str] | None = None
+    last_name: Optional[str] = None
+
+    for line in _iter_lines(path):
+        if line.startswith(b"#"):
+            if not line.startswith(b"#EXTINF:"):
+                # #EXTM3U header and any other directive
                 continue
 
-            url = line
-            attrs = last_attrs or {}
-            name = (last_name or "").strip()
-
-            tvg_id = attrs.get("tvg-id") or attrs.get("channel-id")
-            tvg_name = (
-                attrs.get("tvg-name")
-                or attrs.get("tvc-guide-title")
-                or name
-            )
-
-            raw_group = attrs.get("group-title")
-            group_title = _normalize_group_title(raw_group)
-
-            yield M3UChannel(
-                name=name,
-                url=url,
-                tvg_id=tvg_id,
-                tvg_name=tvg_name,
-                group_title=group_title,
-                raw_attrs=attrs or None,
-            )
-
-            last_attrs = None
-            last_name = None
+            attr_str, name = _extinf_parts(line)
+            last_attrs = _extract_wanted(attr_str)
+            if include_raw_attrs:
+                last_raw = _parse_extinf_attrs(attr_str)
+            last_name = _decode(name).strip()
+            continue
+
+        # URL line. _iter_lines() already applied str.strip() semantics (and
+        # re-encoded non-ASCII lines as clean UTF-8), so only decoding is left.
+        url = line.decode("ascii") if line.isascii() else _decode(line)
+        tvg_id, channel_id, tvg_name, guide_title, group_raw = last_attrs or _NO_WANTED
+        name = last_name or ""
+
+        tvg_id = tvg_id or channel_id
+        tvg_name = (
+            tvg_name
+            or guide_title
+            or name
+        )
+
+        group_title = _normalize_group_title(group_raw)
+        if group_title:
+            # a few dozen titles repeat across thousands of rows; share one object each
+            group_title = sys.intern(group_title)
+
+        yield (name, url, tvg_id, tvg_name, group_title, last_raw or None)
+
+        last_attrs = None
+        last_raw = None
+        last_name = None
+
+
+def read_m3u(path: Path, include_raw_attrs: bool = False) -> Iterator[M3UChannel]:
+    """
+    Parses M3U using a quote-aware regex splitter to handle commas in attributes.
+    raw_attrs (the full attribute dict) is only filled when include_raw_attrs is set.
+    """
+    for name, url, tvg_id, tvg_name, group_title, raw_attrs in _iter_m3u_rows(path, include_raw_attrs):
+        yield M3UChannel(
+            name=name,
+            url=url,
+            tvg_id=tvg_id,
+            tvg_name=tvg_name,
+            group_title=group_title,
+            raw_attrs=raw_attrs,
+        )
+
+
+def read_m3u_list(path: Path, include_raw_attrs: bool = False) -> List[M3UChannel]:
+    """
+    Same as read_m3u(), but returns all channels at once.
+    """
+    return list(read_m3u(path, include_raw_attrs))
+
+
+def read_m3u_rows(path: Path, include_raw_attrs: bool = False) -> List[M3URow]:
+    """
+    Fast path for hot loops: returns raw (name, url, tvg_id, tvg_name,
+    group_title, raw_attrs) tuples instead of M3UChannel objects.
+    raw_attrs is None unless include_raw_attrs is set.
+    """
+    return list(_iter_m3u_rows(path, include_raw_attrs))
+
+
+# Bump whenever the M3URow layout or parse rules change so old sidecars are ignored.
+_PARSED_CACHE_VERSION = 4
+
+
+def _parsed_cache_path(path: Path) -> Path:
+    return path.with_suffix(path.suffix + ".parsed.pkl")
+
+
+def read_m3u_rows_cached(path: Path) -> List[M3URow]:
+    """
+    read_m3u_rows() memoized in a pickle sidecar next to the M3U file.
+    The sidecar is reused while the file's mtime and size are unchanged.
+    """
+    st = path.stat()
+    tag = f"v{_PARSED_CACHE_VERSION}-{st.st_mtime_ns}-{st.st_size}"
+    pkl = _parsed_cache_path(path)
+
+    try:
+        with pkl.open("rb") as f:
+            cached_tag, rows = pickle.load(f)
+        if cached_tag == tag:
+            return rows
+    except Exception:
+        # missing, stale or unreadable sidecar: just reparse
+        pass
+
+    rows = read_m3u_rows(path)
+    try:
+        # per-process temp name: reconcile workers and merge runs may race here
+        tmp = pkl.with_suffix(f"{pkl.suffix}.{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            pickle.dump((tag, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, pkl)
+    except OSError:
+        # cache is best-effort; a read-only cache dir must not break parsing
+        pass
+    return rows
+
+
+def read_m3u_cached(path: Path) -> List[M3UChannel]:
+    """
+    Same as read_m3u_list(), backed by the read_m3u_rows_cached() sidecar.
+    """
+    return [M3UChannel(*row) for row in read_m3u_rows_cached(path)]
+
+
+def count_m3u(path: Path) -> Tuple[int, int, int]:
+    """
+    Count channels in one pass without building channel objects.
+    Returns (channels, with_tvg_id, missing_tvg_id).
+    """
+    ch_count = tvg_count = 0
+    has_id = False
+    for line in _iter_lines(path):
+        if line.startswith(b"#"):
+            if line.startswith(b"#EXTINF:"):
+                # same attr section and last-wins keys as the row parser, so
+                # the counts always agree with read_m3u()
+                tvg_id, channel_id, _, _, _ = _extract_wanted(_extinf_parts(line)[0])
+                has_id = bool(tvg_id or channel_id)
+            continue
+
+        ch_count += 1
+        if has_id:
+            tvg_count += 1
+        has_id = False
+
+    return ch_count, tvg_count, ch_count - tvg_count
@@ -1,14 +1,29 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import csv
+import os
+import shutil
+import sys
+import tempfile
 
-from .fetch import load_config, _cache_filename
-from .parse_m3u import read_m3u
+from .fetch import Provider, load_config, _cache_filename
+from .parse_m3u import read_m3u_rows_cached
 from .parse_epg import read_epg_channels
 
-@dataclass
+# rows buffered per CSV before each writerows() flush
+_CSV_BATCH = 4096
+# plain "\n" rows; only fields that need it (names, groups, odd URLs) get quoted
+_CSV_FMT = dict(lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
+# reason column values, shared by every row instead of rebuilt per row
+_REASON_HAS = sys.intern("has-tvg-id")
+_REASON_EXACT = sys.intern("exact-name-match")
+_REASON_AMB = sys.intern("ambiguous")
+_REASON_NONE = sys.intern("no-match")
+
+@dataclass(slots=True)
 class Suggestion:
     provider: str
     m3u_url: str
@@ -18,6 +33,116 @@ class Suggestion:
     suggested_id: Optional[str]
     reason: str  # "has-tvg-id", "exact-name-match", "ambiguous", "no-match"
 
+def _cached_names(p: Provider, data_dir: Path) -> Set[str]:
+    """
+    File names present in the provider's cache dir (the parent used by
+    _cache_filename), read with one scandir instead of a stat per URL.
+    """
+    try:
+        with os.scandir(data_dir / "cache" / p.slug) as it:
+            return {e.name for e in it}
+    except FileNotFoundError:
+        return set()
+
+def _read_error(path: Path, e: Exception) -> RuntimeError:
+    """
+    Plain, picklable stand-in for a parse error raised in a worker process
+    (lxml's XMLSyntaxError cannot cross the process boundary).
+    """
+    return RuntimeError(f"{path}: {type(e).__name__}: {e}")
+
+def _build_name_map(p: Provider, data_dir: Path, existing: Set[str]) -> Dict[str, Optional[str]]:
+    """
+    EPG lookup for one provider: exact display-name (strip) -> unique channel id,
+    or None if ambiguous.
+    """
+    name_map: Dict[str, Optional[str]] = {}
+    for epg_url in p.epg_urls:
+        epg_path = _cache_filename("epg", p.slug, epg_url, data_dir)
+        if epg_path.name not in existing:
+            continue
+        try:
+            channels = read_epg_channels(epg_path)
+        except Exception as e:
+            raise _read_error(epg_path, e) from None
+        for ch in channels.values():
+            for disp in (ch.display_names or []):
+                key = (disp or "").strip()
+                if not key:
+                    continue
+                prev = name_map.setdefault(key, ch.id)
+                if prev is not None and prev != ch.id:
+                    name_map[key] = None  # ambiguous
+    return name_map
+
+def _process_provider(p: Provider, data_dir: Path, shard_dir: Path, idx: int) -> Tuple[Path, Path]:
+    """
+    Reconcile one provider into its own header-less suggested/missing CSV shards.
+    Runs in a worker process; shards are concatenated by build_suggestions().
+    """
+    suggested_shard = shard_dir / f"suggested_{idx}_{p.slug}.csv"
+    missing_shard   = shard_dir / f"missing_{idx}_{p.slug}.csv"
+
+    prov_key = sys.intern(p.name.strip().lower())
+    existing = _cached_names(p, data_dir)
+    name_map = _build_name_map(p, data_dir, existing)
+
+    with suggested_shard.open("w", newline="", encoding="utf-8", buffering=1 << 20) as fs, \
+         missing_shard.open("w", newline="", encoding="utf-8", buffering=1 << 20) as fm:
+        ws = csv.writer(fs, **_CSV_FMT)
+        wm = csv.writer(fm, **_CSV_FMT)
+
+        # Rows are buffered locally and handed to writerows() in batches.
+        s_buf: List[list] = []
+        m_buf: List[list] = []
+
+        for m3u_url in p.m3u_urls:
+            m3u_path = _cache_filename("m3u", p.slug, m3u_url, data_dir)
+            if m3u_path.name not in existing:
+                continue
+
+            # plain row tuples; raw_attrs (last slot) is never built on this path
+            try:
+                rows = read_m3u_rows_cached(m3u_path)
+            except Exception as e:
+                raise _read_error(m3u_path, e) from None
+
+            for name, url, tvg_id, tvg_name, group_title, _ in rows:
+                if len(s_buf) >= _CSV_BATCH:
+                    ws.writerows(s_buf)
+                    s_buf.clear()
+                if len(m_buf) >= _CSV_BATCH:
+                    wm.writerows(m_buf)
+                    m_buf.clear()
+
+                group = group_title or ""
+                # prefer tvg-name as the display label for matching; fallback to name
+                m3u_label = (tvg_name or name or "").strip()
+
+                # If tvg-id exists, we keep it
+                tvg_id = (tvg_id or "").strip()
+                if tvg_id:
+                    s_buf.append([prov_key, m3u_url, m3u_label, group, url, tvg_id, _REASON_HAS])
+                    continue
+
+                # Exact display-name match
+                if not m3u_label:
+                    m_buf.append([prov_key, m3u_url, "", group, url, _REASON_NONE])
+                    continue
+
+                epg_id = name_map.get(m3u_label)
+                if epg_id is None:
+                    m_buf.append([prov_key, m3u_url, m3u_label, group, url, _REASON_AMB])
+                elif epg_id:
+                    s_buf.append([prov_key, m3u_url, m3u_label, group, url, epg_id, _REASON_EXACT])
+                else:
+                    m_buf.append([prov_key, m3u_url, m3u_label, group, url, _REASON_NONE])
+
+        ws.writerows(s_buf)
+        wm.writerows(m_buf)
+
+    return suggested_shard, missing_shard
+
 def build_suggestions(config_path: Path, data_dir: Path, reports_dir: Path) -> Tuple[Path, Path]:
     """
     Strategy:
@@ -25,71 +150,39 @@ def build_suggestions(config_path: Path, data_dir: Path, reports_dir: Path) -> T
       - Else try EXACT display-name match using (tvg-name if present) else (name), each .strip().
       - If multiple EPG channels share the exact same display-name, mark as "ambiguous".
       - Otherwise, "no-match".
+    Providers are independent, so each one is reconciled in its own worker process.
     """
     cfg = load_config(config_path)
     reports_dir.mkdir(parents=True, exist_ok=True)
 
-    # Build EPG lookup per provider: exact display-name (strip) -> unique channel id or None if ambiguous
-    epg_lookup: Dict[str, Dict[str, Optional[str]]] = {}
-    for p in cfg.providers:
-        prov_key = p.name.strip().lower()
-        name_map: Dict[str, Optional[str]] = {}
-        for epg_url in p.epg_urls:
-            epg_path = _cache_filename("epg", p.slug, epg_url, data_dir)
-            if not epg_path.exists():
-                continue
-            channels = read_epg_channels(epg_path)
-            for ch in channels.values():
-                for disp in (ch.display_names or []):
-                    key = (disp or "").strip()
-                    if not key:
-                        continue
-                    if key in name_map and name_map[key] != ch.id:
-                        name_map[key] = None  # ambiguous
-                    elif key not in name_map:
-                        name_map[key] = ch.id
-        epg_lookup[prov_key] = name_map
-
     suggested_csv = reports_dir / "suggested_id_map.csv"
     missing_csv   = reports_dir / "missing_tvgid.csv"
 
-    with suggested_csv.open("w", newline="", encoding="utf-8") as fs, \
-         missing_csv.open("w", newline="", encoding="utf-8") as fm:
-        ws = csv.writer(fs)
-        wm = csv.writer(fm)
+    with tempfile.TemporaryDirectory(dir=reports_dir, prefix=".reconcile-") as tmp:
+        shard_dir = Path(tmp)
+        shards: Dict[int, Tuple[Path, Path]] = {}
 
-        ws.writerow(["provider","m3u_url","m3u_name","group","stream_url","suggested_tvg_id","reason"])
-        wm.writerow(["provider","m3u_url","m3u_name","group","stream_url","reason"])
+        if cfg.providers:
+            workers = min(len(cfg.providers), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(_process_provider, p, data_dir, shard_dir, idx): idx
+                    for idx, p in enumerate(cfg.providers)
+                }
+                for fut in as_completed(futures):
+                    shards[futures[fut]] = fut.result()
 
-        for p in cfg.providers:
-            prov_key = p.name.strip().lower()
-            name_map = epg_lookup.get(prov_key, {})
-
-            for m3u_url in p.m3u_urls:
-                m3u_path = _cache_filename("m3u", p.slug, m3u_url, data_dir)
-                if not m3u_path.exists():
-                    continue
+        # Stitch shards back together in config order so output is deterministic.
+        with suggested_csv.open("w", newline="", encoding="utf-8", buffering=1 << 20) as fs, \
+             missing_csv.open("w", newline="", encoding="utf-8", buffering=1 << 20) as fm:
+            csv.writer(fs, **_CSV_FMT).writerow(["provider","m3u_url","m3u_name","group","stream_url","suggested_tvg_id","reason"])
+            csv.writer(fm, **_CSV_FMT).writerow(["provider","m3u_url","m3u_name","group","stream_url","reason"])
 
-                for ch in read_m3u(m3u_path):
-                    # prefer tvg-name as the display label for matching; fallback to name
-                    m3u_label = (ch.tvg_name or ch.name or "").strip()
-
-                    # If tvg-id exists, we keep it
-                    if (ch.tvg_id or "").strip():
-                        ws.writerow([prov_key, m3u_url, m3u_label, ch.group_title or "", ch.url, ch.tvg_id.strip(), "has-tvg-id"])
-                        continue
-
-                    # Exact display-name match
-                    if not m3u_label:
-                        wm.writerow([prov_key, m3u_url, "", ch.group_title or "", ch.url, "no-match"])
-                        continue
-
-                    epg_id = name_map.get(m3u_label)
-                    if epg_id is None:
-                        wm.writerow([prov_key, m3u_url, m3u_label, ch.group_title or "", ch.url, "ambiguous"])
-                    elif epg_id:
-                        ws.writerow([prov_key, m3u_url, m3u_label, ch.group_title or "", ch.url, epg_id, "exact-name-match"])
-                    else:
-                        wm.writerow([prov_key, m3u_url, m3u_label, ch.group_title or "", ch.url, "no-match"])
+            for idx in sorted(shards):
+                suggested_shard, missing_shard = shards[idx]
+                with suggested_shard.open("r", newline="", encoding="utf-8") as src:
+                    shutil.copyfileobj(src, fs, 1 << 20)
+                with missing_shard.open("r", newline="", encoding="utf-8") as src:
+                    shutil.copyfileobj(src, fm, 1 << 20)
 
     return suggested_csv, missing_csv
@@ -0,0 +1,105 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+from m3u_merge import fetch
+
+
+class _FakeResponse:
+    def __init__(self, url: str, body: bytes, fail_mid_body: bool = False):
+        self.url = url
+        self.status_code = 200
+        self.headers = {"ETag": '"e1"'}
+        self._body = body
+        self._fail = fail_mid_body
+
+    def iter_content(self, chunk_size=1):
+        yield self._body[:4]
+        if self._fail:
+            raise requests.exceptions.ChunkedEncodingError("connection dropped")
+        yield self._body[4:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    def __init__(self, fail_mid_body: bool = False):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._fail = fail_mid_body
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.calls.append(url)
+        return _FakeResponse(url, f"#EXTM3U\n# {url}\n".encode(), self._fail)
+
+
+def _config(tmp_path: Path, text: str) -> Path:
+    cfg = tmp_path / "providers.yml"
+    cfg.write_text(text, encoding="utf-8")
+    return cfg
+
+
+def test_fetch_all_fetches_a_shared_dst_once(tmp_path, monkeypatch):
+    # "Pluto" and "pluto" share a slug, so the same URL maps to one cache file
+    session = _FakeSession()
+    monkeypatch.setattr(fetch, "_SESSION", session)
+    cfg = _config(tmp_path, """
+providers:
+  - name: Pluto
+    m3u_urls: [http://x/a.m3u]
+  - name: pluto
+    m3u_urls: [http://x/a.m3u, http://x/b.m3u]
+""")
+
+    summaries = fetch.fetch_all(cfg, tmp_path / "data")
+
+    assert sorted(session.calls) == ["http://x/a.m3u", "http://x/b.m3u"]
+    assert [[e["url"] for e in s["m3u"]] for s in summaries] == [
+        ["http://x/a.m3u"],
+        ["http://x/a.m3u", "http://x/b.m3u"],
+    ]
+    shared = fetch._cache_filename("m3u", "pluto", "http://x/a.m3u", tmp_path / "data")
+    assert summaries[0]["m3u"][0]["path"] == summaries[1]["m3u"][0]["path"] == str(shared)
+    assert shared.read_bytes() == b"#EXTM3U\n# http://x/a.m3u\n"
+
+    written = json.loads((tmp_path / "data" / "cache" / "fetch-summary.json").read_text(encoding="utf-8"))
+    assert [s["provider"] for s in written] == ["Pluto", "pluto"]
+
+
+def test_fetch_all_same_url_listed_twice(tmp_path, monkeypatch):
+    session = _FakeSession()
+    monkeypatch.setattr(fetch, "_SESSION", session)
+    cfg = _config(tmp_path, """
+providers:
+  - name: A
+    m3u_urls: [http://x/a.m3u, http://x/a.m3u]
+""")
+
+    (summary,) = fetch.fetch_all(cfg, tmp_path / "data")
+
+    assert session.calls == ["http://x/a.m3u"]
+    assert [e["url"] for e in summary["m3u"]] == ["http://x/a.m3u", "http://x/a.m3u"]
+
+
+def test_failed_body_leaves_no_part_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, "_SESSION", _FakeSession(fail_mid_body=True))
+    cfg = _config(tmp_path, """
+fetch:
+  retries: 0
+providers:
+  - name: A
+    m3u_urls: [http://x/a.m3u]
+""")
+
+    (summary,) = fetch.fetch_all(cfg, tmp_path / "data")
+
+    assert summary["m3u"][0]["path"] is None
+    assert list((tmp_path / "data" / "cache" / "a").iterdir()) == []
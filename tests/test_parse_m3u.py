@@ -0,0 +1,127 @@
+from pathlib import Path
+
+import pytest
+
+from m3u_merge.parse_m3u import count_m3u, read_m3u_list
+
+
+def _write(tmp_path: Path, data: bytes) -> Path:
+    p = tmp_path / "playlist.m3u"
+    p.write_bytes(data)
+    return p
+
+
+def _rows(path: Path):
+    return [(c.name, c.url, c.tvg_id, c.tvg_name, c.group_title) for c in read_m3u_list(path)]
+
+
+# --- line splitting / stripping -------------------------------------------
+
+@pytest.mark.parametrize("nl", [b"\n", b"\r\n", b"\r"])
+def test_line_endings(tmp_path, nl):
+    data = nl.join([
+        b"#EXTM3U",
+        b'#EXTINF:-1 tvg-id="a",A',
+        b"http://a",
+        b"#EXTINF:-1,B",
+        b"http://b",
+    ]) + nl
+    p = _write(tmp_path, data)
+    assert _rows(p) == [
+        ("A", "http://a", "a", "A", None),
+        ("B", "http://b", None, "B", None),
+    ]
+    assert count_m3u(p) == (2, 1, 1)
+
+
+def test_unicode_whitespace_is_stripped(tmp_path):
+    # a leading NBSP must not turn the directive into a URL line
+    p = _write(tmp_path, b'\xc2\xa0#EXTINF:-1 tvg-id="a",A\n\xc2\xa0http://a\xc2\xa0\n')
+    assert _rows(p) == [("A", "http://a", "a", "A", None)]
+    assert count_m3u(p) == (1, 1, 0)
+
+
+def test_ascii_separator_controls_are_stripped(tmp_path):
+    # str.strip() drops \x1c-\x1f; bytes.strip() alone would keep them
+    p = _write(tmp_path, b"#EXTINF:-1,A\x1f\nhttp://a\x1c\n")
+    assert _rows(p) == [("A", "http://a", None, "A", None)]
+
+
+# --- count_m3u agrees with read_m3u ---------------------------------------
+
+@pytest.mark.parametrize("extinf, has_id", [
+    (b'#EXTINF:-1 tvg-id="a",A', True),
+    (b'#EXTINF:-1 channel-id="c",A', True),
+    # last occurrence wins, as in the parsed attrs
+    (b'#EXTINF:-1 channel-id="x" tvg-name="n" channel-id="",A', False),
+    # tvg-id text inside another value or in the channel name is not an attr
+    (b'#EXTINF:-1 tvg-name="tvg-id=\'z\'",A', False),
+    (b'#EXTINF:-1 group-title="x",A tvg-id="k"', False),
+])
+def test_count_matches_read(tmp_path, extinf, has_id):
+    p = _write(tmp_path, b"#EXTM3U\n" + extinf + b"\nhttp://a\n")
+    chans = read_m3u_list(p)
+    assert bool(chans[0].tvg_id) is has_id
+    assert count_m3u(p) == (1, int(has_id), int(not has_id))
+
+
+# --- EXTINF split / attribute parsing -------------------------------------
+
+@pytest.mark.parametrize("extinf, expected", [
+    # quoted comma is not the name separator
+    (b'#EXTINF:-1 tvg-id="a" group-title="News, Weather",ABC News',
+     ("ABC News", "a", "ABC News", "News, Weather")),
+    # comma in the name is kept
+    (b'#EXTINF:-1 tvg-id="a",Name, With Comma',
+     ("Name, With Comma", "a", "Name, With Comma", None)),
+    # unclosed quote: whole line is the header, no name
+    (b'#EXTINF:-1 tvg-id="a" tvg-name="oops,Name',
+     ("", "a", "", None)),
+    # fractional duration and no attrs at all
+    (b'#EXTINF:-1.5 tvg-id="a",A', ("A", "a", "A", None)),
+    (b'#EXTINF:-1,A', ("A", None, "A", None)),
+    (b'#EXTINF:0 ,A', ("A", None, "A", None)),
+    # spaces around "=" and tabs between attrs
+    (b'#EXTINF:-1 tvg-id = "a"\ttvg-name="T",A', ("A", "a", "T", None)),
+    # fallbacks: channel-id for tvg-id, tvc-guide-title for tvg-name
+    (b'#EXTINF:-1 channel-id="c" tvc-guide-title="G",A', ("A", "c", "G", None)),
+    # stray words are folded into the next key, as the original parser did
+    (b'#EXTINF:-1 junk tvg-id="a",A', ("A", None, "A", None)),
+    (b'#EXTINF:-1 junk tvg-name="x",C', ("C", None, "C", None)),
+    # NBSP between "#EXTINF:" and the duration is stripped like whitespace
+    (b'#EXTINF:\xc2\xa0-1 tvg-id="a",A', ("A", "a", "A", None)),
+])
+def test_extinf_parsing(tmp_path, extinf, expected):
+    p = _write(tmp_path, extinf + b"\nhttp://a\n")
+    (c,) = read_m3u_list(p)
+    assert (c.name, c.tvg_id, c.tvg_name, c.group_title) == expected
+    assert count_m3u(p)[1] == int(bool(expected[1]))
+
+
+def test_raw_attrs_only_when_asked(tmp_path):
+    p = _write(tmp_path, b'#EXTINF:-1 tvg-id="a" tvg-logo="l",A\nhttp://a\n')
+    assert read_m3u_list(p)[0].raw_attrs is None
+    assert read_m3u_list(p, include_raw_attrs=True)[0].raw_attrs == {"tvg-id": "a", "tvg-logo": "l"}
+
+
+# --- group-title normalization --------------------------------------------
+
+@pytest.mark.parametrize("group, expected", [
+    ("News", "News"),
+    ("  Sports  ", "Sports"),
+    ("Kids + Family", "Kids & Family"),
+    ("Movies   Drama", "Movies Drama"),
+    ("Not\xc3\xadcias", "Not\xedcias"),
+    ("Espa\xc3\xb1ol + Latino", "Espa\xf1ol & Latino"),
+    ("A\xc2\xa0B", "A B"),
+    # 3- and 4-byte sequences (en dash, emoji) are repaired too
+    ("T\xc3\xa9l\xc3\xa9 \xe2\x80\x93 Films", "T\xe9l\xe9 \u2013 Films"),
+    ("M\xc3\xbasica \xf0\x9f\x8e\xb5", "M\xfasica \U0001f3b5"),
+    # fixable sequences are repaired even next to chars Latin-1 can't hold
+    ("Caf\xc3\xa9 \u2605", "Caf\xe9 \u2605"),
+    ("Caf\xe9", "Caf\xe9"),
+    ("   ", None),
+])
+def test_group_title(tmp_path, group, expected):
+    p = _write(tmp_path, f'#EXTINF:-1 group-title="{group}",A\nhttp://a\n'.encode("utf-8"))
+    assert read_m3u_list(p)[0].group_title == expected
@@ -0,0 +1,75 @@
+import csv
+from pathlib import Path
+
+import pytest
+
+from m3u_merge.fetch import _cache_filename
+from m3u_merge.reconcile import build_suggestions
+
+
+def _cache(data_dir: Path, kind: str, slug: str, url: str, text: str) -> Path:
+    p = _cache_filename(kind, slug, url, data_dir)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    p.write_text(text, encoding="utf-8")
+    return p
+
+
+def _epg(*channels) -> str:
+    body = "".join(f'<channel id="{cid}"><display-name>{name}</display-name></channel>' for cid, name in channels)
+    return f'<?xml version="1.0"?>\n<tv>{body}</tv>\n'
+
+
+def _setup(tmp_path: Path) -> Path:
+    cfg = tmp_path / "providers.yml"
+    cfg.write_text("""
+providers:
+  - name: Alpha
+    m3u_urls: [http://a/1.m3u]
+    epg_urls: [http://a/e.xml]
+  - name: Beta
+    m3u_urls: [http://b/1.m3u]
+    epg_urls: [http://b/e.xml]
+""", encoding="utf-8")
+    data = tmp_path / "data"
+    _cache(data, "m3u", "alpha", "http://a/1.m3u",
+           '#EXTM3U\n#EXTINF:-1 tvg-id="a1",A One\nhttp://a/s1\n#EXTINF:-1,A Two\nhttp://a/s2\n#EXTINF:-1,\nhttp://a/s3\n')
+    _cache(data, "epg", "alpha", "http://a/e.xml", _epg(("a2.id", "A Two")))
+    _cache(data, "m3u", "beta", "http://b/1.m3u",
+           '#EXTM3U\n#EXTINF:-1 group-title="News, Local",B One\nhttp://b/s1\n#EXTINF:-1,\nhttp://b/s2\n')
+    _cache(data, "epg", "beta", "http://b/e.xml", _epg(("b1.id", "B One")))
+    return cfg
+
+
+def _read(path: Path):
+    with path.open(newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_build_suggestions_stitches_shards_in_config_order(tmp_path):
+    cfg = _setup(tmp_path)
+
+    suggested, missing = build_suggestions(cfg, tmp_path / "data", tmp_path / "reports")
+
+    assert _read(suggested) == [
+        ["provider", "m3u_url", "m3u_name", "group", "stream_url", "suggested_tvg_id", "reason"],
+        ["alpha", "http://a/1.m3u", "A One", "", "http://a/s1", "a1", "has-tvg-id"],
+        ["alpha", "http://a/1.m3u", "A Two", "", "http://a/s2", "a2.id", "exact-name-match"],
+        ["beta", "http://b/1.m3u", "B One", "News, Local", "http://b/s1", "b1.id", "exact-name-match"],
+    ]
+    assert _read(missing) == [
+        ["provider", "m3u_url", "m3u_name", "group", "stream_url", "reason"],
+        ["alpha", "http://a/1.m3u", "", "", "http://a/s3", "no-match"],
+        ["beta", "http://b/1.m3u", "", "", "http://b/s2", "no-match"],
+    ]
+    # shard scratch dir is cleaned up
+    assert sorted(p.name for p in (tmp_path / "reports").iterdir()) == ["missing_tvgid.csv", "suggested_id_map.csv"]
+
+
+def test_build_suggestions_reports_corrupt_epg_path(tmp_path):
+    cfg = _setup(tmp_path)
+    epg = _cache_filename("epg", "beta", "http://b/e.xml", tmp_path / "data")
+    epg.write_text('<?xml version="1.0"?>\n<tv><channel id="b1.id"><display-na', encoding="utf-8")
+
+    with pytest.raises(RuntimeError, match="XMLSyntaxError") as exc:
+        build_suggestions(cfg, tmp_path / "data", tmp_path / "reports")
+    assert str(epg) in str(exc.value)